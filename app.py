@@ -1,17 +1,30 @@
 import os
+import logging
 import sqlite3
+import queue
 import json
-from flask import Flask, request, jsonify, send_from_directory
-from pypdf import PdfReader
+import itertools
+import uuid
+import pandas as pd
+from flask import Flask, request, jsonify, send_from_directory, g
+from werkzeug.utils import secure_filename
 import re
+from pdf_text import init_text_cache, save_pdf, extract_page_texts
+from llm_cache import init_cache, prompt_tag, get_cached_items, cache_items
+from parsing import DIGIT_RE, compile_keywords, is_product_id, detect_locale, parse_number, parse_en, parse_es, split_trailing_numbers
 
 app = Flask(__name__, static_folder='static')
+
+# Debug output (extraction traces, raw LLM responses) is off unless LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
+logger = logging.getLogger(__name__)
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # DB Init
 def init_db():
     conn = sqlite3.connect('quotations.db')
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS quotations 
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
@@ -19,11 +32,50 @@ def init_db():
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, quotation_id INTEGER, 
                   supplier_name TEXT, product_name TEXT, sku TEXT, quantity REAL, 
                   unit_price REAL, total_price REAL)''')
+    # Quotations uploaded together share a batch_id; added to databases created before it
+    if 'batch_id' not in {row[1] for row in c.execute("PRAGMA table_info(quotations)")}:
+        c.execute("ALTER TABLE quotations ADD COLUMN batch_id INTEGER")
+    # Exports/latest-batch lookups: index scan + LIMIT 1, then quotations by batch, then items
+    c.execute("CREATE INDEX IF NOT EXISTS idx_quot_date ON quotations(upload_date DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_quot_batch ON quotations(batch_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_quot ON items(quotation_id)")
     conn.commit()
+    conn.execute("PRAGMA optimize")
     conn.close()
+    init_cache()
+    init_text_cache()
 
 init_db()
 
+# Small pool of long-lived connections: each request borrows one via get_conn()
+# and hands it back on teardown, so the page cache stays warm and pragmas are
+# applied once per connection instead of on every request. Connections beyond
+# DB_POOL_SIZE (opened during a burst of concurrent requests) are closed on release.
+DB_POOL_SIZE = 4
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+def get_conn():
+    if 'db' not in g:
+        try:
+            g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            g.db = sqlite3.connect('quotations.db', check_same_thread=False)
+            g.db.row_factory = sqlite3.Row
+            g.db.execute("PRAGMA synchronous=NORMAL")
+            g.db.execute("PRAGMA cache_size=-20000")
+    return g.db
+
+@app.teardown_appcontext
+def release_conn(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _db_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
 @app.route('/')
 def index():
     return send_from_directory('static', 'index.html')
@@ -32,188 +84,245 @@ def index():
 def serve_static(path):
     return send_from_directory('static', path)
 
-def parse_number(num_str):
-    # Remove common currency symbols and whitespace
-    clean_str = num_str.upper().replace('$', '').replace('€', '').replace('S/', '').replace('USD', '').replace('EUR', '').strip()
-    
-    # Remove internal spaces (e.g. "1 200.00")
-    clean_str = clean_str.replace(' ', '')
-    
-    if not clean_str: return None
+import hashlib
+import threading
+from collections import OrderedDict
+import google.generativeai as genai
+from google.generativeai import client as genai_client
 
-    # Check for Spanish format (1.234,56) vs English (1,234.56)
-    # Heuristic: 
-    # If ',' is the last separator and it's after a '.', it's Spanish.
-    # If ',' is the only separator, it's Spanish decimal.
-    # If '.' is the only separator, it's English decimal.
-    
-    try:
-        if ',' in clean_str and '.' in clean_str:
-            last_comma = clean_str.rfind(',')
-            last_dot = clean_str.rfind('.')
-            if last_comma > last_dot: # 1.234,56
-                clean_str = clean_str.replace('.', '').replace(',', '.')
-            else: # 1,234.56
-                clean_str = clean_str.replace(',', '')
-        elif ',' in clean_str: 
-            # Ambiguous: 123,456 (English int) or 123,45 (Spanish float)?
-            # If it has 3 digits after comma, likely English thousands.
-            # But in prices, 3 decimals is rare. 2 is common.
-            parts = clean_str.split(',')
-            if len(parts[-1]) == 2: # Likely decimal
-                clean_str = clean_str.replace(',', '.')
-            elif len(parts[-1]) == 3: # Likely thousands
-                clean_str = clean_str.replace(',', '')
-            else: # Fallback to decimal
-                clean_str = clean_str.replace(',', '.')
-        
-        return float(clean_str)
-    except ValueError:
-        return None
+# Static extraction rules, sent once as the model's system instruction so each
+# request only carries the PDF text.
+EXTRACTION_RULES = """
+You are a parser that converts PDF price quotations into structured line items.
+The input contains one or more PDF documents, each starting with a line "===DOC n===".
+You MUST always return a JSON object with a top-level docs array holding one entry
+per document: {"docs": [{"id": n, "items": [...]}, ...]}.
+Each element in items is an object with:
 
-import google.generativeai as genai
+supplier_name (string)
+product_name (string)
+product_id (string or null)
+quantity (number or null)
+unit_price (number or null)
+tax_amount (number or null)
+transport_cost (number or null)
+total_price (number or null)
 
-def extract_with_llm(text, api_key):
-    try:
-        print(f"Configuring Gemini with API key: {api_key[:10]}...")
+Rules:
+If the PDF is messy or unclear, make your best reasonable guess.
+If some value is missing or not numeric, use null instead of skipping the whole item.
+Never return an empty items array. If you can only find one rough line item, return that.
+Never mix line items from different documents.
+"""
+
+# Structured output: Gemini returns JSON matching this schema directly
+ITEM_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'supplier_name': {'type': 'string'},
+        'product_name': {'type': 'string'},
+        'product_id': {'type': 'string', 'nullable': True},
+        'quantity': {'type': 'number', 'nullable': True},
+        'unit_price': {'type': 'number', 'nullable': True},
+        'tax_amount': {'type': 'number', 'nullable': True},
+        'transport_cost': {'type': 'number', 'nullable': True},
+        'total_price': {'type': 'number', 'nullable': True},
+    },
+    'required': ['supplier_name', 'product_name'],
+}
+
+RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'docs': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'id': {'type': 'integer'},
+                    'items': {'type': 'array', 'items': ITEM_SCHEMA},
+                },
+                'required': ['id', 'items'],
+            },
+        },
+    },
+    'required': ['docs'],
+}
+
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Cached LLM results are only reused for this model, rules and schema
+LLM_CACHE_TAG = prompt_tag(MODEL_NAME, EXTRACTION_RULES, RESPONSE_SCHEMA)
+
+# One GenerativeModel per API key, reused across uploads. Keyed by a hash so the
+# secret isn't kept as a dict key, and bounded so rotating keys can't grow it.
+MAX_MODELS = 8
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+def get_model(api_key):
+    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    with _models_lock:
+        model = _models.get(key_hash)
+        if model is not None:
+            _models.move_to_end(key_hash)
+            return model
+
+        # genai.configure is process-wide, so configuring and binding the client
+        # happen under the lock: GenerativeModel would otherwise pick up its client
+        # lazily on the first call, from whichever key another thread set last.
+        logger.debug("Configuring Gemini for API key %s...", key_hash[:8])
         genai.configure(api_key=api_key)
-        
-        # Try to list available models first
+
+        # Listing available models is a network round-trip, only worth it when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                logger.debug("Fetching available models...")
+                for m in genai.list_models():
+                    if 'generateContent' in m.supported_generation_methods:
+                        logger.debug("  - %s", m.name)
+            except Exception as e:
+                logger.debug("Could not list models: %s", e)
+
+        model = genai.GenerativeModel(
+            MODEL_NAME,
+            system_instruction=EXTRACTION_RULES,
+            generation_config={'response_mime_type': 'application/json', 'response_schema': RESPONSE_SCHEMA}
+        )
+        model._client = genai_client.get_default_generative_client()
+        _models[key_hash] = model
+        if len(_models) > MAX_MODELS:
+            _models.popitem(last=False)
+    return model
+
+# The response grows with the input (every item is echoed back as JSON), so a big
+# batch runs out of output tokens and comes back as truncated, unparseable JSON.
+# Uncached documents are split into calls of at most this many documents/characters.
+MAX_DOCS_PER_CALL = 4
+MAX_CHARS_PER_CALL = 40000
+
+def llm_batches(pending, texts):
+    # Groups indexes into texts; a single document over the character cap gets a call of its own
+    batch, chars = [], 0
+    for i in pending:
+        if batch and (len(batch) == MAX_DOCS_PER_CALL or chars + len(texts[i]) > MAX_CHARS_PER_CALL):
+            yield batch
+            batch, chars = [], 0
+        batch.append(i)
+        chars += len(texts[i])
+    if batch:
+        yield batch
+
+def extract_with_llm(texts, api_key):
+    # Returns one items list per text (empty where extraction failed). Uncached
+    # documents go to Gemini in as few batched calls as the caps above allow.
+    results = [get_cached_items(text, LLM_CACHE_TAG) for text in texts]
+    pending = [i for i, items in enumerate(results) if items is None]
+    logger.debug("LLM cache hits: %d of %d documents", len(texts) - len(pending), len(texts))
+    
+    for batch in llm_batches(pending, texts):
         try:
-            print("Fetching available models...")
-            for m in genai.list_models():
-                if 'generateContent' in m.supported_generation_methods:
-                    print(f"  - {m.name}")
+            model = get_model(api_key)
+            prompt = "".join(f"===DOC {n}===\n{texts[i]}\n" for n, i in enumerate(batch, 1))
+
+            logger.debug("Calling Gemini API for %d documents...", len(batch))
+            response = model.generate_content(prompt)
+            finish_reason = response.candidates[0].finish_reason.name
+            if finish_reason != 'STOP':
+                logger.warning("Gemini response for %d documents ended with %s", len(batch), finish_reason)
+            logger.debug("Gemini response received: %d characters", len(response.text))
+            
+            # JSON mode: the response is the schema-shaped object, no fences to strip
+            logger.debug("Raw response (first 200 chars): %.200s", response.text)
+            data = json.loads(response.text)
+            docs = {doc['id']: doc['items'] for doc in data['docs']}
+            
+            for n, i in enumerate(batch, 1):
+                items = docs.get(n, [])
+                logger.debug("Successfully extracted %d items via LLM for document %d", len(items), i + 1)
+                if items:
+                    cache_items(texts[i], items, LLM_CACHE_TAG)
+                results[i] = items
         except Exception as e:
-            print(f"Could not list models: {e}")
-        
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt = """
-        You are a parser that converts PDF price quotations into structured line items.
-        You MUST always return a JSON object with a top-level items array.
-        Each element in items is an object with:
-
-        supplier_name (string)
-        product_name (string)
-        product_id (string or null)
-        quantity (number or null)
-        unit_price (number or null)
-        tax_amount (number or null)
-        transport_cost (number or null)
-        total_price (number or null)
-
-        Rules:
-        If the PDF is messy or unclear, make your best reasonable guess.
-        If some value is missing or not numeric, use null instead of skipping the whole item.
-        Never return an empty items array. If you can only find one rough line item, return that.
-        Do not include explanations or comments – output ONLY valid JSON.
-        
-        Here is the text content of the PDF:
-        """ + text
+            logger.warning("LLM Extraction failed for %d documents: %s: %s", len(batch), type(e).__name__, e,
+                           exc_info=logger.isEnabledFor(logging.DEBUG))
+    
+    return [items or [] for items in results]
 
-        print("Calling Gemini API...")
-        response = model.generate_content(prompt)
-        print(f"Gemini response received: {len(response.text)} characters")
-        
-        # Clean up response to ensure it's just JSON
-        content = response.text
-        print(f"Raw response (first 200 chars): {content[:200]}")
-        
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        print(f"Cleaned JSON (first 200 chars): {content[:200]}")
-        data = json.loads(content)
-        
-        # Handle both formats: direct array or object with items key
-        if isinstance(data, list):
-            items = data
-        else:
-            items = data.get('items', [])
-        
-        print(f"Successfully extracted {len(items)} items via LLM")
-        return items
-    except Exception as e:
-        print(f"LLM Extraction failed: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return []
+# Supplier detection skips the document title/metadata lines at the top
+SKIP_WORDS_RE = compile_keywords(["FACTURA", "QUOTATION", "PRESUPUESTO", "FECHA", "DATE", "PAGINA", "PAGE", "NIT", "RUC"])
+
+# Enhanced header/metadata detection
+HEADER_KEYWORDS_RE = compile_keywords([
+    "DOCUMENTO", "RNC:", "CLIENTE:", "VENDEDOR:", "CONDICION:", "VENCE:",
+    "HORA:", "FECHA:", "REFERENCIA:", "TELEFONO", "TEL:", "LOCAL",
+    "REPARTO", "DIAS", "PÁGINA", "PAGE", "CANT.", "PRECIO", "DESC.",
+    "ITBIS", "IMPORTE", "DESCRIPCIÓN", "DESCRIPCION"
+])
 
 def extract_items_from_text(text):
     # Fallback Heuristic Extraction
     if not text or len(text.strip()) < 10:
-        print("Text is empty or too short")
+        logger.debug("Text is empty or too short")
         return [] 
+    if not DIGIT_RE.search(text):
+        logger.debug("Text has no numbers, nothing to extract")
+        return []
 
-    print(f"Extracting from text (first 500 chars): {text[:500]}")
+    logger.debug("Extracting from text (first 500 chars): %.500s", text)
+    return extract_items_from_lines(text.split('\n'))
+
+def extract_items_from_lines(lines):
+    # Works on any iterable of lines (e.g. a generator over PDF pages) in a
+    # single pass, so the whole document never has to be held as one string.
+    lines = iter(lines)
     items = []
-    lines = text.split('\n')
+    fallback_items = []
     
+    # Supplier and number-format detection only need the first lines; they are re-chained below
+    head = list(itertools.islice(lines, 50))
     supplier_name = "Unknown Supplier"
-    skip_words = ["FACTURA", "QUOTATION", "PRESUPUESTO", "FECHA", "DATE", "PAGINA", "PAGE", "NIT", "RUC"]
-    for line in lines[:15]:
-        l = line.strip().upper()
-        if l and not any(w in l for w in skip_words) and len(l) > 3:
-            supplier_name = line.strip()
+    for line in head[:15]:
+        l = line.strip()
+        if l and not SKIP_WORDS_RE.search(l) and len(l) > 3:
+            supplier_name = l
             break
-
-    # Enhanced header/metadata detection
-    header_keywords = [
-        "DOCUMENTO", "RNC:", "CLIENTE:", "VENDEDOR:", "CONDICION:", "VENCE:",
-        "HORA:", "FECHA:", "REFERENCIA:", "TELEFONO", "TEL:", "LOCAL",
-        "REPARTO", "DIAS", "PÁGINA", "PAGE", "CANT.", "PRECIO", "DESC.",
-        "ITBIS", "IMPORTE", "DESCRIPCIÓN", "DESCRIPCION"
-    ]
     
-    # Strategy 1: Look for lines that appear to be product data
-    for line in lines:
+    # Bind a parser specialised for the document's number format, if it is consistent
+    locale = detect_locale(token for line in head for token in line.split())
+    parse = {'en': parse_en, 'es': parse_es}.get(locale, parse_number)
+
+    for line in itertools.chain(head, lines):
         line = line.strip()
         if not line or len(line) < 10: continue
+        if not DIGIT_RE.search(line): continue  # no price on this line
         
-        # Skip headers and metadata
-        upper_line = line.upper()
-        is_header = False
-        for keyword in header_keywords:
-            if keyword in upper_line and len(line) < 60:  # Headers are usually shorter
-                is_header = True
-                break
+        # Keyword match and split are done once per line and shared by both strategies
+        is_header = HEADER_KEYWORDS_RE.search(line) is not None
+        parts = line.split()
+        
+        # Strategy 2 candidates are only collected until Strategy 1 finds an item
+        # (with stricter header filtering: any keyword, whatever the line length)
+        if not items and not is_header:
+            fallback_item = extract_fallback_item(parts, supplier_name, parse)
+            if fallback_item:
+                fallback_items.append(fallback_item)
         
-        if is_header:
+        # Strategy 1: Look for lines that appear to be product data
+        # Skip headers and metadata
+        if is_header and len(line) < 60:  # Headers are usually shorter
             continue
         
         # Skip lines that are clearly not product data
-        if line.startswith("Página") or line.startswith("Cliente:") or line.startswith("Vendedor:"):
+        if line.startswith(("Página", "Cliente:", "Vendedor:")):
             continue
             
-        parts = line.split()
         if len(parts) < 3:  # Need at least product code, description, and some numbers
             continue
         
         # Scan from RIGHT to LEFT to find trailing numbers (the data columns)
         # Stop when we hit text (the description)
-        trailing_numbers = []
-        text_parts = []
-        found_text_after_numbers = False
-        
-        for i in range(len(parts) - 1, -1, -1):
-            p = parts[i]
-            val = parse_number(p)
-            
-            if val is not None and val > 0 and val < 1000000:
-                if not found_text_after_numbers:
-                    # Still in the number columns at the end
-                    trailing_numbers.insert(0, val)
-                else:
-                    # We already found text, so this number is part of description
-                    # (like "EXIST: 78")
-                    text_parts.insert(0, p)
-            else:
-                # Hit text
-                found_text_after_numbers = True
-                text_parts.insert(0, p)
+        text_parts, trailing_numbers = split_trailing_numbers(parts, parse)
         
         # We need at least 2 trailing numbers to be a valid product line
         if len(trailing_numbers) >= 2:
@@ -222,7 +331,7 @@ def extract_items_from_text(text):
             description_parts = []
             
             for part in text_parts:
-                if product_id is None and any(c.isdigit() for c in part) and any(c.isalpha() for c in part):
+                if product_id is None and is_product_id(part):
                     product_id = part
                 else:
                     description_parts.append(part)
@@ -275,248 +384,222 @@ def extract_items_from_text(text):
                 "transport_cost": None,
                 "total_price": total_price
             })
+            fallback_items = []
 
-    print(f"Strategy 1 found {len(items)} items")
+    logger.debug("Strategy 1 found %d items", len(items))
 
     # If we still have no items, be more aggressive but filter better
     if len(items) == 0:
-        print("Strategy 1 failed, trying aggressive fallback...")
-        for line in lines:
-            line = line.strip()
-            if not line or len(line) < 10: continue
-            
-            # Stricter header filtering
-            upper_line = line.upper()
-            if any(kw in upper_line for kw in header_keywords):
-                continue
-            
-            parts = line.split()
-            nums = []
-            text_parts = []
-            for p in parts:
-                v = parse_number(p)
-                if v is not None and v > 0 and v < 1000000:  # Reasonable range
-                    nums.append(v)
-                else:
-                    text_parts.append(p)
-            
-            if len(nums) >= 1 and text_parts:
-                price = nums[-1]
-                desc = " ".join(text_parts[:10])
-                
-                items.append({
-                    "supplier_name": supplier_name,
-                    "product_name": desc.strip(),
-                    "product_id": None,
-                    "quantity": 1,
-                    "unit_price": price,
-                    "tax_amount": None,
-                    "transport_cost": None,
-                    "total_price": price
-                })
-
-    print(f"Total items extracted: {len(items)}")
+        logger.debug("Strategy 1 failed, using aggressive fallback...")
+        items = fallback_items
+
+    logger.debug("Total items extracted: %d", len(items))
     return items
 
+def extract_fallback_item(parts, supplier_name, parse=parse_number):
+    # Strategy 2: any non-header line (already split) with text and at least one number
+    nums = []
+    text_parts = []
+    for p in parts:
+        v = parse(p)
+        if v is not None and v > 0 and v < 1000000:  # Reasonable range
+            nums.append(v)
+        else:
+            text_parts.append(p)
+    
+    if len(nums) >= 1 and text_parts:
+        price = nums[-1]
+        desc = " ".join(text_parts[:10])
+        
+        return {
+            "supplier_name": supplier_name,
+            "product_name": desc.strip(),
+            "product_id": None,
+            "quantity": 1,
+            "unit_price": price,
+            "tax_amount": None,
+            "transport_cost": None,
+            "total_price": price
+        }
+    return None
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
+    # Accepts several PDFs as 'files' (compared together) or a single one as 'file'
+    files = request.files.getlist('files') or request.files.getlist('file')
+    if not files:
         return jsonify({'error': 'No file part'}), 400
-    file = request.files['file']
     api_key = request.form.get('api_key')
     
-    if file.filename == '':
+    if any(file.filename == '' for file in files):
         return jsonify({'error': 'No selected file'}), 400
     
-    filepath = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(filepath)
-    
     try:
-        reader = PdfReader(filepath)
-        text = ""
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted: text += extracted + "\n"
-        
-        if not text.strip():
-             return jsonify({'error': 'No text found in PDF. This might be a scanned image (OCR required).'}), 400
+        # One entry per file, in upload order: quotation_id and item_count once
+        # saved, or an error. A file that fails doesn't stop the others being saved.
+        quotations = []
+        documents = []
+        for file in files:
+            # Stream the upload to disk (hashing as it is copied) and let PyMuPDF
+            # read the saved file, instead of holding a second copy in memory. Each
+            # upload gets its own path, so a concurrent upload with the same name
+            # can't replace the file between hashing and parsing.
+            filename = secure_filename(file.filename) or 'upload.pdf'
+            filepath = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
+            file.stream.seek(0)
+            key = save_pdf(file.stream, filepath)
+            
+            page_texts = extract_page_texts(filepath, key)
+            entry = {'filename': file.filename}
+            quotations.append(entry)
+            if not any(page_text.strip() for page_text in page_texts):
+                entry['error'] = f'No text found in {file.filename}. This might be a scanned image (OCR required).'
+                continue
+            documents.append((entry, page_texts))
 
-        items = []
         if api_key and len(api_key) > 10:
-            print("Using LLM for extraction...")
-            items = extract_with_llm(text, api_key)
-            if not items:
-                print("LLM returned no items, falling back to heuristic.")
-                items = extract_items_from_text(text)
+            # The LLM needs each whole document as one string
+            texts = ["".join(page_text + "\n" for page_text in page_texts if page_text) for _, page_texts in documents]
+            logger.debug("Using LLM for extraction...")
+            results = extract_with_llm(texts, api_key)
+            for i, items in enumerate(results):
+                if not items:
+                    logger.debug("LLM returned no items for %s, falling back to heuristic.", documents[i][0]['filename'])
+                    results[i] = extract_items_from_text(texts[i])
         else:
-            items = extract_items_from_text(text)
+            # Heuristic parser streams lines page by page
+            results = [extract_items_from_lines(line for page_text in page_texts for line in page_text.split('\n'))
+                       for _, page_texts in documents]
         
-        if not items:
-             return jsonify({'error': 'Could not extract any items.'}), 400
+        extracted = []
+        for (entry, _), items in zip(documents, results):
+            if items:
+                extracted.append((entry, items))
+            else:
+                entry['error'] = f'Could not extract any items from {entry["filename"]}.'
+        
+        if not extracted:
+            # Nothing to save: report the first failure, with the per-file details
+            return jsonify({'error': quotations[0]['error'], 'quotations': quotations}), 400
         
         # Save to DB
-        conn = sqlite3.connect('quotations.db')
+        conn = get_conn()
         c = conn.cursor()
-        c.execute("INSERT INTO quotations (filename) VALUES (?)", (file.filename,))
-        quotation_id = c.lastrowid
         
         saved_items = []
-        for item in items:
-            # Handle potential nulls from LLM
-            qty = item.get('quantity') or 0
-            price = item.get('unit_price') or 0
-            total = item.get('total_price') or (qty * price)
-            product_id = item.get('product_id', None)
-            
-            c.execute("INSERT INTO items (quotation_id, supplier_name, product_name, sku, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                      (quotation_id, item.get('supplier_name', 'Unknown'), item.get('product_name', 'Unknown'), 
-                       product_id, qty, price, total))
-            
-            item['id'] = c.lastrowid
-            saved_items.append(item)
-        conn.commit()
-        conn.close()
+        # One transaction for all quotations and their items; they share a batch
+        # (the first quotation's id) so exports can cover the whole upload
+        batch_id = None
+        with conn:
+            for entry, items in extracted:
+                quotation_id = save_quotation(c, entry['filename'], items, batch_id)
+                batch_id = batch_id or quotation_id
+                entry.update(quotation_id=quotation_id, item_count=len(items))
+                for item in items:
+                    item['quotation_id'] = quotation_id
+                saved_items.extend(items)
         
-        return jsonify({'quotation_id': quotation_id, 'items': saved_items})
+        return jsonify({'quotation_id': extracted[-1][0]['quotation_id'], 'items': saved_items, 'quotations': quotations})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def save_quotation(c, filename, items, batch_id=None):
+    # Inserts a quotation and its items, setting item['id'] on each; caller commits.
+    # Without a batch_id the quotation starts a new batch of its own.
+    rows = []
+    for item in items:
+        # Handle potential nulls from LLM
+        qty = item.get('quantity') or 0
+        price = item.get('unit_price') or 0
+        total = item.get('total_price') or (qty * price)
+        product_id = item.get('product_id', None)
+        rows.append((item.get('supplier_name', 'Unknown'), item.get('product_name', 'Unknown'),
+                     product_id, qty, price, total))
+    
+    c.execute("INSERT INTO quotations (filename, batch_id) VALUES (?, ?)", (filename, batch_id))
+    quotation_id = c.lastrowid
+    if batch_id is None:
+        c.execute("UPDATE quotations SET batch_id = id WHERE id = ?", (quotation_id,))
+    c.executemany("INSERT INTO items (quotation_id, supplier_name, product_name, sku, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  [(quotation_id,) + row for row in rows])
+    # executemany() doesn't report per-row ids; read them back in insertion order
+    c.execute("SELECT id FROM items WHERE quotation_id = ? ORDER BY id", (quotation_id,))
+    for item, (item_id,) in zip(items, c.fetchall()):
+        item['id'] = item_id
+    return quotation_id
+
 @app.route('/api/items', methods=['GET'])
 def get_items():
-    conn = sqlite3.connect('quotations.db')
-    conn.row_factory = sqlite3.Row
+    conn = get_conn()
     c = conn.cursor()
     c.execute("SELECT * FROM items")
     rows = c.fetchall()
-    conn.close()
     return jsonify([dict(row) for row in rows])
 
 @app.route('/api/items/<int:id>', methods=['PUT'])
 def update_item(id):
     data = request.json
-    conn = sqlite3.connect('quotations.db')
+    conn = get_conn()
     c = conn.cursor()
     c.execute("UPDATE items SET product_name=?, quantity=?, unit_price=?, total_price=? WHERE id=?",
               (data['product_name'], data['quantity'], data['unit_price'], data['total_price'], id))
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
+def get_latest_batch_frame(sku_label):
+    # Items from every quotation of the most recent upload, with export column
+    # names, in one query. Quotations saved without a batch_id are a batch of one.
+    return pd.read_sql_query(f"""
+        WITH latest AS (SELECT COALESCE(batch_id, id) AS batch_id FROM quotations
+                        ORDER BY upload_date DESC, id DESC LIMIT 1)
+        SELECT id AS "ID", quotation_id AS "Quotation ID", supplier_name AS "Supplier",
+               product_name AS "Product Name", COALESCE(sku, '') AS "{sku_label}",
+               quantity AS "Quantity", unit_price AS "Unit Price", total_price AS "Total Price"
+        FROM items
+        WHERE quotation_id IN (SELECT q.id FROM quotations q, latest
+                               WHERE q.batch_id = latest.batch_id OR q.id = latest.batch_id)
+        ORDER BY quotation_id, id""", get_conn())
+
 @app.route('/api/export', methods=['GET'])
 def export_csv():
-    import csv
     from io import StringIO
     from flask import Response
     
-    conn = sqlite3.connect('quotations.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Get the most recent quotation ID
-    c.execute("SELECT id FROM quotations ORDER BY upload_date DESC LIMIT 1")
-    latest_quotation = c.fetchone()
-    
-    if latest_quotation:
-        # Only export items from the latest quotation
-        c.execute("SELECT * FROM items WHERE quotation_id = ?", (latest_quotation['id'],))
-        rows = c.fetchall()
-    else:
-        rows = []
-    
-    conn.close()
+    # Only export items from the latest upload (all of its quotations)
+    df = get_latest_batch_frame('SKU')
     
     # Create CSV in memory
     output = StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['ID', 'Quotation ID', 'Supplier', 'Product Name', 'SKU', 'Quantity', 'Unit Price', 'Total Price'])
-    
-    # Write data
-    for row in rows:
-        writer.writerow([row['id'], row['quotation_id'], row['supplier_name'], 
-                        row['product_name'], row['sku'] or '', row['quantity'], 
-                        row['unit_price'], row['total_price']])
+    df.to_csv(output, index=False)
     
-    output.seek(0)
     return Response(output.getvalue(), mimetype='text/csv', 
                    headers={"Content-Disposition": "attachment;filename=quotations_export.csv"})
 
 @app.route('/api/export-excel', methods=['GET'])
 def export_excel():
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment
     from io import BytesIO
     from flask import Response
     
-    conn = sqlite3.connect('quotations.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Get the most recent quotation ID
-    c.execute("SELECT id FROM quotations ORDER BY upload_date DESC LIMIT 1")
-    latest_quotation = c.fetchone()
-    
-    if latest_quotation:
-        # Only export items from the latest quotation
-        c.execute("SELECT * FROM items WHERE quotation_id = ?", (latest_quotation['id'],))
-        rows = c.fetchall()
-    else:
-        rows = []
-    
-    conn.close()
-    
-    # Create Excel workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Quotations"
+    # Only export items from the latest upload (all of its quotations)
+    df = get_latest_batch_frame('Product ID')
     
-    # Define headers
-    headers = ['ID', 'Quotation ID', 'Supplier', 'Product Name', 'Product ID', 'Quantity', 'Unit Price', 'Total Price']
-    ws.append(headers)
-    
-    # Style the header row
-    header_fill = PatternFill(start_color="4F46E5", end_color="4F46E5", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Write data rows
-    for row in rows:
-        # Get product_id from the items - check if sku column exists, otherwise use None
-        product_id = row['sku'] if 'sku' in row.keys() else None
-        
-        ws.append([
-            row['id'], 
-            row['quotation_id'], 
-            row['supplier_name'],
-            row['product_name'], 
-            product_id or '',
-            row['quantity'], 
-            row['unit_price'], 
-            row['total_price']
-        ])
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
+    # Auto-adjust column widths (longest value or header + padding, capped at 50)
+    # One vectorized length pass per column, without copying the whole frame to strings
+    widths = {col: min(max(df[col].astype(str).str.len().max() if len(df) else 0, len(col)) + 2, 50)
+              for col in df.columns}
     
-    # Save to BytesIO
     output = BytesIO()
-    wb.save(output)
-    output.seek(0)
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        # Data goes in below a styled header row written separately
+        df.to_excel(writer, sheet_name='Quotations', index=False, header=False, startrow=1)
+        ws = writer.sheets['Quotations']
+        header_format = writer.book.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#4F46E5',
+            'align': 'center', 'valign': 'vcenter'
+        })
+        ws.write_row(0, 0, df.columns, header_format)
+        for i, col in enumerate(df.columns):
+            ws.set_column(i, i, widths[col])
     
     return Response(
         output.getvalue(),
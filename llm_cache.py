@@ -0,0 +1,67 @@
+import hashlib
+import json
+import re
+import sqlite3
+
+# Exact-match cache of Gemini extraction results, keyed by the PDF text.
+# Re-uploading the same quotation (or re-running extraction in Streamlit)
+# returns the stored items instead of paying for another LLM call.
+# Keys also carry a tag for the model, rules and schema that produced the items
+# (see prompt_tag), so results from an older prompt or from the other app aren't reused.
+# The cache lives in the application database, so it is an LRU: once it holds more
+# than MAX_CACHED_RESULTS entries, the least recently used ones are dropped.
+
+DB_PATH = 'quotations.db'
+MAX_CACHED_RESULTS = 500
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def init_cache():
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                    (text_sha256 TEXT PRIMARY KEY, items_json TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     last_used INTEGER)''')
+    # last_used is a use counter (higher = more recent), added after the table; older rows keep insertion order
+    if 'last_used' not in {row[1] for row in conn.execute("PRAGMA table_info(llm_cache)")}:
+        conn.execute("ALTER TABLE llm_cache ADD COLUMN last_used INTEGER")
+        conn.execute("UPDATE llm_cache SET last_used = rowid")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used)")
+    conn.commit()
+    conn.close()
+
+def prompt_tag(model_name, system_instruction, response_schema):
+    # Changes whenever the model, the rules or the schema do
+    payload = json.dumps([model_name, system_instruction, response_schema], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def text_key(text, tag):
+    # Normalize whitespace so the same PDF extracted with different line breaks hits the cache
+    normalized = _WHITESPACE_RE.sub(' ', text).strip()
+    return hashlib.sha256(f"{tag}\n{normalized}".encode('utf-8')).hexdigest()
+
+def get_cached_items(text, tag):
+    key = text_key(text, tag)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        row = conn.execute("SELECT items_json FROM llm_cache WHERE text_sha256 = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE llm_cache SET last_used = (SELECT MAX(last_used) + 1 FROM llm_cache) "
+                     "WHERE text_sha256 = ?", (key,))
+        conn.commit()
+        return json.loads(row[0])
+    finally:
+        conn.close()
+
+def cache_items(text, items, tag):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO llm_cache (text_sha256, items_json, last_used) "
+                         "VALUES (?, ?, (SELECT COALESCE(MAX(last_used), 0) + 1 FROM llm_cache))",
+                         (text_key(text, tag), json.dumps(items)))
+            conn.execute("""DELETE FROM llm_cache WHERE text_sha256 NOT IN
+                            (SELECT text_sha256 FROM llm_cache ORDER BY last_used DESC LIMIT ?)""",
+                         (MAX_CACHED_RESULTS,))
+    finally:
+        conn.close()
@@ -0,0 +1,124 @@
+import itertools
+import re
+
+# Shared by app.py and streamlit_app.py so the patterns are compiled once per process.
+
+# Currency symbols/codes and whitespace stripped from a numeric token before parsing.
+# re.I lets us match "usd" / "s/" without building an uppercase copy of the token.
+CURRENCY_RE = re.compile(r'\$|€|S/|USD|EUR|\s+', re.I)
+
+# Every character parse_number can turn into (part of) a number: digits, sign,
+# separators, exponent, whitespace and the currency markers above. Tokens with anything
+# else are rejected by a C-level frozenset check instead of a failed float().
+NUMERIC_CHARS = frozenset('0123456789,.-+eE$€SUDRsudr/ \t\r\n\xa0')
+
+# Every item line carries at least one price, so lines (or whole documents)
+# without a digit are skipped before any splitting or parsing.
+DIGIT_RE = re.compile(r'[0-9]')
+
+def is_numeric_token(num_str):
+    # The charset alone lets words made of currency letters through ("de", "se",
+    # "red", "sus"), so a number must also contain a digit; that check runs first
+    # since it rejects nearly every description word.
+    return DIGIT_RE.search(num_str) is not None and NUMERIC_CHARS.issuperset(num_str)
+
+# Separator translation tables, applied once the number format is known.
+SPANISH_DECIMAL = str.maketrans({'.': None, ',': '.'})  # 1.234,56 -> 1234.56
+ENGLISH_DECIMAL = str.maketrans({',': None})             # 1,234.56 -> 1234.56
+COMMA_DECIMAL = str.maketrans({',': '.'})                # 123,45   -> 123.45
+
+def parse_number(num_str):
+    # Most tokens in a line are plain words; reject them without a regex or a failed float()
+    if not is_numeric_token(num_str): return None
+    
+    # Remove common currency symbols and whitespace (e.g. "$ 1 200.00")
+    clean_str = CURRENCY_RE.sub('', num_str)
+    
+    if not clean_str: return None
+
+    # Check for Spanish format (1.234,56) vs English (1,234.56)
+    # Heuristic: 
+    # If ',' is the last separator and it's after a '.', it's Spanish.
+    # If ',' is the only separator, it's Spanish decimal.
+    # If '.' is the only separator, it's English decimal.
+    
+    try:
+        last_comma = clean_str.rfind(',')
+        if last_comma != -1:
+            last_dot = clean_str.rfind('.')
+            if last_dot != -1:
+                if last_comma > last_dot: # 1.234,56
+                    clean_str = clean_str.translate(SPANISH_DECIMAL)
+                else: # 1,234.56
+                    clean_str = clean_str.translate(ENGLISH_DECIMAL)
+            # Ambiguous: 123,456 (English int) or 123,45 (Spanish float)?
+            # If it has 3 digits after comma, likely English thousands.
+            # But in prices, 3 decimals is rare. 2 is common.
+            elif len(clean_str) - last_comma == 4: # Likely thousands
+                clean_str = clean_str.translate(ENGLISH_DECIMAL)
+            else: # Likely decimal
+                clean_str = clean_str.translate(COMMA_DECIMAL)
+        
+        return float(clean_str)
+    except ValueError:
+        return None
+
+def split_trailing_numbers(parts, parse=parse_number):
+    # Returns (text_parts, trailing_numbers): the run of valid numbers at the
+    # end of the line and everything before it. Once we hit text, the rest is
+    # description (numbers in it like "EXIST: 78" stay text), so it is never parsed.
+    end = len(parts)
+    trailing_numbers = []
+    while end > 0:
+        val = parse(parts[end - 1])
+        if val is None or not 0 < val < 1000000:
+            break
+        trailing_numbers.append(val)
+        end -= 1
+    trailing_numbers.reverse()
+    return parts[:end], trailing_numbers
+
+def is_product_id(part):
+    # A product code mixes letters and digits (e.g. "AB-1234", "M²"). Uses
+    # str.isdigit/isalpha exactly, so "1½" is not a code; only runs on lines
+    # that already have two trailing numbers.
+    return any(c.isdigit() for c in part) and any(c.isalpha() for c in part)
+
+def compile_keywords(keywords):
+    # One case-insensitive alternation for a keyword list, so a line is scanned
+    # in a single pass instead of once per keyword (and without upper()).
+    return re.compile('|'.join(map(re.escape, keywords)), re.I)
+
+# Most quotations use one number format throughout, so it is detected once per
+# document and tokens go through a specialised parser with no separator branching.
+# Evidence is the separator in front of a 2-digit decimal part ("12.50" / "12,50").
+DECIMAL_SUFFIX_RE = re.compile(r'([.,])\d{2}$')
+LOCALE_SAMPLE_SIZE = 20
+
+def detect_locale(tokens):
+    # 'en' (1,234.56) or 'es' (1.234,56) when the first sampled decimals all agree,
+    # None for mixed or missing evidence (callers keep the per-token heuristic)
+    matches = filter(None, map(DECIMAL_SUFFIX_RE.search, tokens))
+    seen = {m.group(1) for m in itertools.islice(matches, LOCALE_SAMPLE_SIZE)}
+    if seen == {'.'}: return 'en'
+    if seen == {','}: return 'es'
+    return None
+
+# The locale only tells which separator groups thousands. Tokens shaped like that
+# locale's numbers ("1.234,56" / "1,234.56", or no separator at all) take the fast
+# path; anything else ("1.5" in a Spanish document, dates like "15.03.24") goes
+# through the per-token heuristic rather than having every separator dropped.
+EN_NUMBER_RE = re.compile(r'-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?')
+ES_NUMBER_RE = re.compile(r'-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?')
+
+def parse_en(num_str):
+    if not is_numeric_token(num_str): return None
+    clean_str = CURRENCY_RE.sub('', num_str)
+    if not EN_NUMBER_RE.fullmatch(clean_str): return parse_number(num_str)
+    return float(clean_str.translate(ENGLISH_DECIMAL))
+
+def parse_es(num_str):
+    if not is_numeric_token(num_str): return None
+    clean_str = CURRENCY_RE.sub('', num_str)
+    if not ES_NUMBER_RE.fullmatch(clean_str): return parse_number(num_str)
+    return float(clean_str.translate(SPANISH_DECIMAL))
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import sqlite3
+import pymupdf
+
+# Page text extraction shared by app.py and streamlit_app.py, using PyMuPDF
+# (MuPDF's C text extractor). Words are regrouped into visual rows so table
+# columns stay on one line, in reading order. Pages are extracted sequentially:
+# at a few milliseconds per page, starting and feeding worker processes costs more
+# than the extraction itself, and forking inside the threaded servers can deadlock.
+
+# Page texts are cached by the SHA-256 of the PDF bytes, so re-uploading the
+# same file (or re-running extraction in Streamlit) skips parsing entirely.
+# The extractor name is hashed in too, so text cached by a different one isn't reused.
+# The cache lives in the application database, so it is an LRU: once it holds more
+# than MAX_CACHED_PDFS documents, the least recently used ones are dropped.
+DB_PATH = 'quotations.db'
+EXTRACTOR = 'pymupdf-rows'
+MAX_CACHED_PDFS = 200
+
+# Uploads are copied to disk in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+def _open(pdf):
+    # pdf is either the PDF bytes or a path to the file
+    if isinstance(pdf, (bytes, bytearray)):
+        return pymupdf.open(stream=pdf, filetype='pdf')
+    return pymupdf.open(pdf, filetype='pdf')
+
+def _page_text(page):
+    # MuPDF starts a new line (and often a new block) at every wide column gap,
+    # so a table row would come out one cell per line. Rebuild the visual rows
+    # instead: words (x0, y0, x1, y1, word, ...) whose bottoms sit within half a
+    # word height of each other form one row, joined left to right with spaces.
+    words = page.get_text('words')
+    words.sort(key=lambda word: (word[3], word[0]))
+    rows = []
+    row_bottom = None
+    for word in words:
+        if row_bottom is None or word[3] - row_bottom > (word[3] - word[1]) / 2:
+            rows.append([])
+            row_bottom = word[3]
+        rows[-1].append(word)
+    return "".join(" ".join(word[4] for word in sorted(row)) + "\n" for row in rows)
+
+def init_text_cache():
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute('''CREATE TABLE IF NOT EXISTS pdf_text_cache
+                    (pdf_sha256 TEXT PRIMARY KEY, pages_json TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                     last_used INTEGER)''')
+    # last_used is a use counter (higher = more recent), added after the table; older rows keep insertion order
+    if 'last_used' not in {row[1] for row in conn.execute("PRAGMA table_info(pdf_text_cache)")}:
+        conn.execute("ALTER TABLE pdf_text_cache ADD COLUMN last_used INTEGER")
+        conn.execute("UPDATE pdf_text_cache SET last_used = rowid")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pdf_text_last_used ON pdf_text_cache(last_used)")
+    conn.commit()
+    conn.close()
+
+def _new_digest():
+    return hashlib.sha256(EXTRACTOR.encode())
+
+def _cache_key(pdf):
+    digest = _new_digest()
+    if isinstance(pdf, (bytes, bytearray)):
+        digest.update(pdf)
+    else:
+        with open(pdf, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def save_pdf(stream, filepath):
+    # Copies an upload stream to disk chunk by chunk, hashing on the way, so the
+    # file is never held in memory as a whole. Returns its cache key.
+    digest = _new_digest()
+    with open(filepath, 'wb') as f:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def extract_page_texts(pdf, key=None):
+    # pdf is the PDF bytes or a file path; key is its cache key if already known
+    # (from save_pdf). Returns one string per page, in page order ('' for pages without text)
+    if key is None:
+        key = _cache_key(pdf)
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        row = conn.execute("SELECT pages_json FROM pdf_text_cache WHERE pdf_sha256 = ?", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE pdf_text_cache SET last_used = (SELECT MAX(last_used) + 1 FROM pdf_text_cache) "
+                         "WHERE pdf_sha256 = ?", (key,))
+            conn.commit()
+            return json.loads(row[0])
+        
+        page_texts = _extract_page_texts(pdf)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO pdf_text_cache (pdf_sha256, pages_json, last_used) "
+                         "VALUES (?, ?, (SELECT COALESCE(MAX(last_used), 0) + 1 FROM pdf_text_cache))",
+                         (key, json.dumps(page_texts)))
+            conn.execute("""DELETE FROM pdf_text_cache WHERE pdf_sha256 NOT IN
+                            (SELECT pdf_sha256 FROM pdf_text_cache ORDER BY last_used DESC LIMIT ?)""",
+                         (MAX_CACHED_PDFS,))
+        return page_texts
+    finally:
+        conn.close()
+
+def _extract_page_texts(pdf):
+    with _open(pdf) as doc:
+        return [_page_text(page) for page in doc]
@@ -3,11 +3,12 @@ let allItems = [];
 async function uploadFile() {
     const fileInput = document.getElementById('pdfUpload');
     const apiKeyInput = document.getElementById('apiKey');
-    const file = fileInput.files[0];
-    if (!file) return alert('Please select a file');
+    const files = Array.from(fileInput.files);
+    if (!files.length) return alert('Please select a file');
 
+    // All selected quotations go up in one request so they are extracted together
     const formData = new FormData();
-    formData.append('file', file);
+    files.forEach(file => formData.append('files', file));
     if (apiKeyInput && apiKeyInput.value) {
         formData.append('api_key', apiKeyInput.value);
     }
@@ -21,12 +22,18 @@ async function uploadFile() {
         });
         const data = await res.json();
 
-        if (data.error) throw new Error(data.error);
+        // Each file reports its own outcome: a quotation_id once saved, or an error
+        const quotations = data.quotations || [];
+        const failed = quotations.filter(q => q.error);
+        if (data.error) throw new Error(failed.length ? failed.map(q => q.error).join('\n') : data.error);
 
-        document.getElementById('uploadStatus').innerText = 'Extraction complete!';
+        document.getElementById('uploadStatus').innerText = failed.length
+            ? ['Extraction complete, but some files were skipped:', ...failed.map(q => q.error)].join('\n')
+            : 'Extraction complete!';
         // Add new items to local state
         allItems = [...allItems, ...data.items];
-        renderTable(data.items, `Extracted from ${file.name}`);
+        const saved = quotations.filter(q => q.quotation_id);
+        renderTable(data.items, `Extracted from ${saved.map(q => q.filename).join(', ')}`);
     } catch (e) {
         document.getElementById('uploadStatus').innerText = 'Error: ' + e.message;
     }
@@ -3,10 +3,16 @@ import pandas as pd
 import sqlite3
 import json
 import os
-from pypdf import PdfReader
+import itertools
+import hashlib
+import threading
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 from io import BytesIO
 import re
+from pdf_text import init_text_cache, extract_page_texts
+from llm_cache import init_cache, prompt_tag, get_cached_items, cache_items
+from parsing import DIGIT_RE, compile_keywords, is_product_id, detect_locale, parse_number, parse_en, parse_es, split_trailing_numbers
 
 # Page Config
 st.set_page_config(
@@ -18,6 +24,7 @@ st.set_page_config(
 # --- Database Functions ---
 def init_db():
     conn = sqlite3.connect('quotations.db')
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS quotations 
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
@@ -25,25 +32,36 @@ def init_db():
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, quotation_id INTEGER, 
                   supplier_name TEXT, product_name TEXT, sku TEXT, quantity REAL, 
                   unit_price REAL, total_price REAL)''')
+    # Exports/latest-quotation lookups: index scan + LIMIT 1, then items by quotation
+    c.execute("CREATE INDEX IF NOT EXISTS idx_quot_date ON quotations(upload_date DESC, id DESC)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_items_quot ON items(quotation_id)")
     conn.commit()
+    conn.execute("PRAGMA optimize")
     conn.close()
+    init_cache()
+    init_text_cache()
 
 def save_to_db(filename, items):
     conn = sqlite3.connect('quotations.db')
+    conn.execute("PRAGMA synchronous=NORMAL")
     c = conn.cursor()
-    c.execute("INSERT INTO quotations (filename) VALUES (?)", (filename,))
-    quotation_id = c.lastrowid
     
+    rows = []
     for item in items:
         qty = item.get('quantity') or 0
         price = item.get('unit_price') or 0
         total = item.get('total_price') or (qty * price)
         product_id = item.get('product_id', None)
-        
-        c.execute("INSERT INTO items (quotation_id, supplier_name, product_name, sku, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (quotation_id, item.get('supplier_name', 'Unknown'), item.get('product_name', 'Unknown'), 
-                   product_id, qty, price, total))
-    conn.commit()
+        rows.append((item.get('supplier_name', 'Unknown'), item.get('product_name', 'Unknown'),
+                     product_id, qty, price, total))
+    
+    # One transaction for the quotation and all of its items
+    with conn:
+        c.execute("INSERT INTO quotations (filename) VALUES (?)", (filename,))
+        quotation_id = c.lastrowid
+        c.executemany("INSERT INTO items (quotation_id, supplier_name, product_name, sku, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                      [(quotation_id,) + row for row in rows])
+    conn.execute("PRAGMA optimize")
     conn.close()
     return quotation_id
 
@@ -52,7 +70,7 @@ def get_latest_quotation_items():
     # Use pandas for easier dataframe handling
     try:
         # Get latest quotation ID
-        latest_q = pd.read_sql_query("SELECT id FROM quotations ORDER BY upload_date DESC LIMIT 1", conn)
+        latest_q = pd.read_sql_query("SELECT id FROM quotations ORDER BY upload_date DESC, id DESC LIMIT 1", conn)
         if not latest_q.empty:
             q_id = latest_q.iloc[0]['id']
             items = pd.read_sql_query("SELECT * FROM items WHERE quotation_id = ?", conn, params=(int(q_id),))
@@ -66,109 +84,132 @@ def get_latest_quotation_items():
         conn.close()
 
 # --- Parsing Logic (Ported from app.py) ---
-def parse_number(num_str):
-    if not isinstance(num_str, str): return num_str
-    clean_str = num_str.upper().replace('$', '').replace('€', '').replace('S/', '').replace('USD', '').replace('EUR', '').strip()
-    clean_str = clean_str.replace(' ', '')
-    if not clean_str: return None
+EXTRACTION_RULES = """
+You are a parser that converts PDF price quotations into structured line items.
+You MUST always return a JSON object with a top-level items array.
+Each element in items is an object with:
+supplier_name (string), product_name (string), product_id (string or null),
+quantity (number or null), unit_price (number or null), tax_amount (number or null),
+transport_cost (number or null), total_price (number or null)
 
-    try:
-        if ',' in clean_str and '.' in clean_str:
-            last_comma = clean_str.rfind(',')
-            last_dot = clean_str.rfind('.')
-            if last_comma > last_dot: # 1.234,56
-                clean_str = clean_str.replace('.', '').replace(',', '.')
-            else: # 1,234.56
-                clean_str = clean_str.replace(',', '')
-        elif ',' in clean_str: 
-            parts = clean_str.split(',')
-            if len(parts[-1]) == 2: clean_str = clean_str.replace(',', '.')
-            elif len(parts[-1]) == 3: clean_str = clean_str.replace(',', '')
-            else: clean_str = clean_str.replace(',', '.')
-        return float(clean_str)
-    except ValueError:
-        return None
+Rules:
+If the PDF is messy or unclear, make your best reasonable guess.
+If some value is missing or not numeric, use null instead of skipping the whole item.
+Never return an empty items array. If you can only find one rough line item, return that.
+"""
+
+# Structured output: Gemini returns JSON matching this schema directly
+ITEMS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'items': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'supplier_name': {'type': 'string'},
+                    'product_name': {'type': 'string'},
+                    'product_id': {'type': 'string', 'nullable': True},
+                    'quantity': {'type': 'number', 'nullable': True},
+                    'unit_price': {'type': 'number', 'nullable': True},
+                    'tax_amount': {'type': 'number', 'nullable': True},
+                    'transport_cost': {'type': 'number', 'nullable': True},
+                    'total_price': {'type': 'number', 'nullable': True},
+                },
+                'required': ['supplier_name', 'product_name'],
+            },
+        },
+    },
+    'required': ['items'],
+}
+
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Cached LLM results are only reused for this model, rules and schema
+LLM_CACHE_TAG = prompt_tag(MODEL_NAME, EXTRACTION_RULES, ITEMS_SCHEMA)
+
+# genai.configure is process-wide and Streamlit runs sessions in threads, so the
+# client is bound under a lock while this key is the configured one
+_configure_lock = threading.Lock()
+
+@st.cache_resource(max_entries=8)
+def _build_model(key_hash, _api_key):
+    # Built once per API key and kept across reruns; the rules go in as the
+    # system instruction so each call only sends the PDF text. Cached on the
+    # key's hash (underscore arguments aren't hashed), never the key itself.
+    with _configure_lock:
+        genai.configure(api_key=_api_key)
+        model = genai.GenerativeModel(
+            MODEL_NAME,
+            system_instruction=EXTRACTION_RULES,
+            generation_config={'response_mime_type': 'application/json', 'response_schema': ITEMS_SCHEMA}
+        )
+        model._client = genai_client.get_default_generative_client()
+    return model
+
+def get_model(api_key):
+    return _build_model(hashlib.sha256(api_key.encode()).hexdigest(), api_key)
 
 def extract_with_llm(text, api_key):
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        cached = get_cached_items(text, LLM_CACHE_TAG)
+        if cached is not None:
+            return cached
         
-        prompt = """
-        You are a parser that converts PDF price quotations into structured line items.
-        You MUST always return a JSON object with a top-level items array.
-        Each element in items is an object with:
-        supplier_name (string), product_name (string), product_id (string or null),
-        quantity (number or null), unit_price (number or null), tax_amount (number or null),
-        transport_cost (number or null), total_price (number or null)
-
-        Rules:
-        If the PDF is messy or unclear, make your best reasonable guess.
-        If some value is missing or not numeric, use null instead of skipping the whole item.
-        Never return an empty items array. If you can only find one rough line item, return that.
-        Do not include explanations or comments – output ONLY valid JSON.
-        
-        Here is the text content of the PDF:
-        """ + text
+        model = get_model(api_key)
+        prompt = "Here is the text content of the PDF:\n" + text
 
         response = model.generate_content(prompt)
-        content = response.text
-        
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        
-        data = json.loads(content)
-        if isinstance(data, list):
-            return data
-        else:
-            return data.get('items', [])
+        items = json.loads(response.text)['items']  # JSON mode, no fences to strip
+        if items:
+            cache_items(text, items, LLM_CACHE_TAG)
+        return items
     except Exception as e:
         st.error(f"LLM Extraction failed: {str(e)}")
         return []
 
+HEADER_KEYWORDS_RE = compile_keywords(["DOCUMENTO", "RNC:", "CLIENTE:", "VENDEDOR:", "FECHA:", "TEL:", "PÁGINA", "CANT.", "PRECIO", "DESCRIPCIÓN"])
+
 def extract_items_from_text(text):
     # Simplified heuristic fallback (same logic as app.py but condensed)
     if not text or len(text.strip()) < 10: return []
+    if not DIGIT_RE.search(text): return []  # e.g. a cover letter, no prices at all
+    return extract_items_from_lines(text.split('\n'))
+
+def extract_items_from_lines(lines):
+    # Single pass over any iterable of lines (e.g. streamed page by page)
+    lines = iter(lines)
     items = []
-    lines = text.split('\n')
+    head = list(itertools.islice(lines, 50))
     supplier_name = "Unknown Supplier"
     # Basic supplier detection
-    for line in lines[:15]:
-        if len(line.strip()) > 3 and "FACTURA" not in line.upper():
-            supplier_name = line.strip()
+    for line in head[:15]:
+        line = line.strip()
+        if len(line) > 3 and "FACTURA" not in line.upper():
+            supplier_name = line
             break
-            
-    header_keywords = ["DOCUMENTO", "RNC:", "CLIENTE:", "VENDEDOR:", "FECHA:", "TEL:", "PÁGINA", "CANT.", "PRECIO", "DESCRIPCIÓN"]
-    
-    for line in lines:
+    # Number format detected once per document (None = mixed, keep the generic parser)
+    locale = detect_locale(token for line in head for token in line.split())
+    parse = {'en': parse_en, 'es': parse_es}.get(locale, parse_number)
+
+    for line in itertools.chain(head, lines):
         line = line.strip()
         if not line or len(line) < 10: continue
-        if any(kw in line.upper() for kw in header_keywords): continue
+        if not DIGIT_RE.search(line): continue  # no price on this line
+        if HEADER_KEYWORDS_RE.search(line): continue
         
         parts = line.split()
         if len(parts) < 3: continue
         
         # Right-to-left number scanning
-        trailing_numbers = []
-        text_parts = []
-        found_text = False
-        
-        for i in range(len(parts) - 1, -1, -1):
-            val = parse_number(parts[i])
-            if val is not None and 0 < val < 1000000 and not found_text:
-                trailing_numbers.insert(0, val)
-            else:
-                found_text = True
-                text_parts.insert(0, parts[i])
+        text_parts, trailing_numbers = split_trailing_numbers(parts, parse)
         
         if len(trailing_numbers) >= 2:
             # Extract logic
             product_id = None
             desc_parts = []
             for part in text_parts:
-                if product_id is None and any(c.isdigit() for c in part) and any(c.isalpha() for c in part):
+                if product_id is None and is_product_id(part):
                     product_id = part
                 else:
                     desc_parts.append(part)
@@ -214,21 +255,19 @@ if uploaded_file is not None:
     if st.button("Extract Data", type="primary"):
         with st.spinner("Extracting data..."):
             try:
-                reader = PdfReader(uploaded_file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
+                page_texts = extract_page_texts(uploaded_file.getvalue())
                 
                 items = []
                 if api_key:
                     st.toast("Using Gemini AI for extraction...")
+                    text = "".join(page_text + "\n" for page_text in page_texts)
                     items = extract_with_llm(text, api_key)
                     if not items:
                         st.warning("Gemini returned no items, falling back to heuristic parser.")
                         items = extract_items_from_text(text)
                 else:
                     st.toast("Using heuristic parser...")
-                    items = extract_items_from_text(text)
+                    items = extract_items_from_lines(line for page_text in page_texts for line in page_text.split('\n'))
                 
                 if items:
                     save_to_db(uploaded_file.name, items)
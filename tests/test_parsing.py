@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import parsing
+
+@pytest.mark.parametrize("part, expected", [
+    ("AB-1234", True),
+    ("AB123", True),
+    ("M²", True),    # superscript two is a digit, so units like m² are codes
+    ("1½", False),   # vulgar fractions are numeric but not digits or letters
+    ("Ⅻ", False),
+    ("Tornillo", False),
+    ("125.00", False),
+])
+def test_is_product_id_matches_isdigit_isalpha(part, expected):
+    assert parsing.is_product_id(part) is expected
+
+def test_split_trailing_numbers_stops_at_description():
+    parts = "AB123 Tornillo M8 x 30 10 12.50 125.00".split()
+    assert parsing.split_trailing_numbers(parts) == (["AB123", "Tornillo", "M8", "x"], [30.0, 10.0, 12.5, 125.0])
+
+@pytest.mark.parametrize("token", ["de", "se", "red", "sus", "USD", "S/"])
+def test_words_of_currency_letters_are_not_numeric(token):
+    assert not parsing.is_numeric_token(token)
+    assert parsing.parse_number(token) is None
+
+@pytest.mark.parametrize("tokens, expected", [
+    (["Tuerca", "10", "12.50", "1,234.56"], 'en'),
+    (["Tuerca", "10", "12,50", "1.234,56"], 'es'),
+    (["12,50", "3.10"], None),  # mixed evidence
+    (["Tuerca", "10"], None),   # no decimals to go on
+])
+def test_detect_locale(tokens, expected):
+    assert parsing.detect_locale(tokens) == expected
+
+@pytest.mark.parametrize("token, expected", [
+    ("1,234.56", 1234.56),
+    ("$1,200.00", 1200.0),
+    ("12.50", 12.5),
+    ("10", 10.0),
+    ("2,5", 2.5),          # not an English grouping: per-token heuristic
+    ("15.03.24", None),
+    ("Tuerca", None),
+])
+def test_parse_en(token, expected):
+    assert parsing.parse_en(token) == expected
+
+@pytest.mark.parametrize("token, expected", [
+    ("1.234,56", 1234.56),
+    ("S/ 1.200,00", 1200.0),
+    ("12,50", 12.5),
+    ("10", 10.0),
+    ("1.5", 1.5),          # not a Spanish grouping: per-token heuristic
+    ("15.03.24", None),    # a date, not 150324
+    ("Tuerca", None),
+])
+def test_parse_es(token, expected):
+    assert parsing.parse_es(token) == expected
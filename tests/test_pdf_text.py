@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pymupdf
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdf_text
+
+ROWS = [
+    ("AB123", "Tornillo de acero inox", "10", "12.50", "125.00"),
+    ("AB124", "Tuerca M8", "20", "1.50", "30.00"),
+    ("AB125", "Arandela plana", "100", "0.20", "20.00"),
+]
+
+def make_table_pdf(gap):
+    # Each cell is placed at its own x position, like a tabular quotation
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "Ferreteria Central SRL")
+    for i, row in enumerate(ROWS):
+        x = 50
+        for cell in row:
+            page.insert_text((x, 100 + i * 18), cell)
+            x += pymupdf.get_text_length(cell) + gap
+    return doc.tobytes()
+
+@pytest.mark.parametrize("gap", [3, 6, 10, 15, 25])
+def test_table_rows_stay_on_one_line(gap):
+    lines = pdf_text._extract_page_texts(make_table_pdf(gap))[0].splitlines()
+    assert lines == ["Ferreteria Central SRL"] + [" ".join(row) for row in ROWS]
+
+def test_extract_page_texts_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_text, 'DB_PATH', str(tmp_path / 'cache.db'))
+    pdf_text.init_text_cache()
+    pdf_bytes = make_table_pdf(25)
+    first = pdf_text.extract_page_texts(pdf_bytes)
+    monkeypatch.setattr(pdf_text, '_extract_page_texts', lambda pdf: pytest.fail("cache miss"))
+    assert pdf_text.extract_page_texts(pdf_bytes) == first
+
+def test_text_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_text, 'DB_PATH', str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(pdf_text, 'MAX_CACHED_PDFS', 2)
+    pdf_text.init_text_cache()
+    first, second, third = (make_table_pdf(gap) for gap in (3, 10, 25))
+    pdf_text.extract_page_texts(first)
+    pdf_text.extract_page_texts(second)
+    pdf_text.extract_page_texts(first)  # hit: first is now more recent than second
+    pdf_text.extract_page_texts(third)
+    monkeypatch.setattr(pdf_text, '_extract_page_texts', lambda pdf: pytest.fail("cache miss"))
+    pdf_text.extract_page_texts(first)
+    pdf_text.extract_page_texts(third)
+    monkeypatch.setattr(pdf_text, '_extract_page_texts', lambda pdf: ["evicted"])
+    assert pdf_text.extract_page_texts(second) == ["evicted"]